@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class IngredientsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cookbook.ingredients'
+
+    def ready(self):
+        from cookbook.ingredients import signals  # noqa: F401
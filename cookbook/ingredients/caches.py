@@ -0,0 +1,98 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+
+from cookbook.ingredients.models import Category
+
+# Everything here lives in the default cache. settings.py does not configure
+# CACHES, so that is Django's per-process LocMemCache: each worker keeps its own
+# copy, and invalidation only reaches the process that ran the write. Point
+# CACHES at a shared backend (Redis, Memcached) before running several workers;
+# until then the timeouts below bound how stale another worker can be.
+
+# Cache key for the total ingredient count
+INGREDIENT_COUNT_CACHE_KEY = "ingredients:count"
+
+# Timeout (in seconds) for the cached total ingredient count
+INGREDIENT_COUNT_CACHE_TIMEOUT = 60
+
+# Timeout (in seconds) for cached ingredient list results
+INGREDIENTS_LIST_CACHE_TIMEOUT = 60
+
+# Cache key for the generation counter mixed into ingredient list cache keys
+INGREDIENTS_GENERATION_CACHE_KEY = "ingredients:generation"
+
+# Timeout (in seconds) for cached category ids; saves and deletes clear them sooner
+CATEGORY_ID_CACHE_TIMEOUT = 300
+
+
+def get_category_id_cache_key(name):
+    """
+    Returns the cache key for the id of the category with the given name.
+    """
+    digest = hashlib.blake2b(name.encode(), digest_size=16).hexdigest()
+    return f"categories:id:{digest}"
+
+
+def get_cached_category_id(name):
+    """
+    Returns the cached id of the category with the given name, or None if it is not cached.
+    """
+    return cache.get(get_category_id_cache_key(name))
+
+
+def get_or_create_category_id(name):
+    """
+    Looks up the id of the category with the given name, creating the category if
+    needed, and caches it.
+    """
+    category_id = Category.objects.filter(
+        name=name).values_list("id", flat=True).first()
+    if category_id is None:
+        # A no-op on the unique name if another request created it meanwhile
+        Category.objects.bulk_create(
+            [Category(name=name)], ignore_conflicts=True)
+        category_id = Category.objects.values_list(
+            "id", flat=True).get(name=name)
+    cache.set(get_category_id_cache_key(name),
+              category_id, CATEGORY_ID_CACHE_TIMEOUT)
+    return category_id
+
+
+def forget_category_id(name):
+    """
+    Drops the cached id of the category with the given name.
+    """
+    cache.delete(get_category_id_cache_key(name))
+
+
+def get_ingredients_generation():
+    """
+    Returns the current generation of the ingredient list cache.
+    """
+    # Seeded from the clock so a lost counter never reuses an old generation
+    return cache.get_or_set(INGREDIENTS_GENERATION_CACHE_KEY, time.time_ns, None)
+
+
+def bump_ingredients_generation():
+    """
+    Invalidates every cached ingredient list by moving to a new generation.
+    """
+    try:
+        cache.incr(INGREDIENTS_GENERATION_CACHE_KEY)
+    except ValueError:
+        cache.set(INGREDIENTS_GENERATION_CACHE_KEY, time.time_ns(), None)
+
+
+def get_ingredients_cache_key(filter_data, order_input, first=None, offset=None, after_id=None):
+    """
+    Builds the cache key for an ingredient list from its normalized arguments.
+    """
+    order = None
+    if order_input:
+        order = (order_input.field.value, order_input.direction.value)
+    arguments = repr(
+        (sorted(filter_data.items()), order, first, offset, after_id))
+    digest = hashlib.blake2b(arguments.encode(), digest_size=16).hexdigest()
+    return f"ingredients:list:{get_ingredients_generation()}:{digest}"
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.17 on 2026-10-15 09:12
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_categories(apps, schema_editor):
+    """
+    Folds categories that share a name into the oldest one, so the unique
+    constraint can be added.
+    """
+    Category = apps.get_model('ingredients', 'Category')
+    Ingredient = apps.get_model('ingredients', 'Ingredient')
+    duplicates = (
+        Category.objects.values('name')
+        .annotate(keep_id=Min('id'), total=Count('id'))
+        .filter(total__gt=1)
+    )
+    for duplicate in duplicates:
+        extra = Category.objects.filter(
+            name=duplicate['name']).exclude(pk=duplicate['keep_id'])
+        Ingredient.objects.filter(category__in=extra).update(
+            category_id=duplicate['keep_id'])
+        extra.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingredients', '0002_alter_ingredient_name'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_categories, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='category',
+            name='name',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+    ]
@@ -2,7 +2,15 @@ from django.db import models
 
 
 class Category(models.Model):
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, unique=True)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored name so a rename can be spotted without a query
+        if "name" in field_names:
+            instance._loaded_name = instance.name
+        return instance
 
     def __str__(self):
         return self.name
@@ -1,9 +1,27 @@
 import graphene
-from graphql import GraphQLError
+from graphql import FieldNode, FragmentSpreadNode, GraphQLError, InlineFragmentNode
 from graphene_django import DjangoObjectType
+from django.core.cache import cache
 from django.core.exceptions import FieldError
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Window
+from cookbook.ingredients.caches import (
+    INGREDIENT_COUNT_CACHE_KEY,
+    INGREDIENT_COUNT_CACHE_TIMEOUT,
+    INGREDIENTS_LIST_CACHE_TIMEOUT,
+    get_cached_category_id,
+    get_ingredients_cache_key,
+    get_or_create_category_id,
+)
 from cookbook.ingredients.models import Category, Ingredient
 
+# Page size used when a list query does not pass first, and the largest page allowed
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 200
+
+# Lookups passed straight to queryset.filter(), matching IngredientFilterInput
+INGREDIENT_FILTER_LOOKUPS = ("name__iexact", "name__icontains", "id")
+
 # Helper function for filtering
 
 
@@ -26,21 +44,77 @@ def apply_ordering(queryset, order_input):
     Applies ordering to a queryset based on the provided order input.
     """
     if order_input:
-        direction = '-' if order_input.direction == OrderDirection.DESC else ''
-        return queryset.order_by(f"{direction}{order_input.field.value}")
-    return queryset
+        return queryset.order_by(
+            INGREDIENT_ORDERINGS[order_input.field, order_input.direction])
+    # Without an explicit order, pages would slice rows in no defined order
+    return queryset.order_by("id")
 
 # Helper function for pagination
 
 
-def apply_pagination(queryset, first=None, offset=None):
+def apply_pagination(queryset, first=None, offset=None, after_id=None):
     """
-    Applies pagination to a queryset based on the provided first and offset values.
+    Applies pagination to a queryset based on the provided first, offset and after_id values.
     """
+    if after_id is not None:
+        # Keyset pagination: continue in id order after the last id seen
+        queryset = queryset.filter(id__gt=after_id).order_by("id")
     offset = offset or 0
-    if first is not None:
-        return queryset[offset: offset + first]
-    return queryset[offset:]
+    # Never load an unbounded page; clients continue with offset or after_id
+    if first is None:
+        first = DEFAULT_PAGE_SIZE
+    first = min(first, MAX_PAGE_SIZE)
+    return queryset[offset: offset + first]
+
+
+# Helper function for selection sets
+
+
+def collect_selections(selection_set, fragments, tree=None):
+    """
+    Collects the fields requested in a selection set into a nested dict,
+    following inline fragments and fragment spreads.
+    """
+    tree = {} if tree is None else tree
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            subtree = tree.setdefault(selection.name.value, {})
+            if selection.selection_set:
+                collect_selections(selection.selection_set, fragments, subtree)
+        elif isinstance(selection, InlineFragmentNode):
+            collect_selections(selection.selection_set, fragments, tree)
+        elif isinstance(selection, FragmentSpreadNode):
+            fragment = fragments[selection.name.value]
+            collect_selections(fragment.selection_set, fragments, tree)
+    return tree
+
+
+def get_selections(info):
+    """
+    Returns the nested dict of fields the client requested on the field being resolved.
+    """
+    tree = {}
+    for field_node in info.field_nodes:
+        if field_node.selection_set:
+            collect_selections(field_node.selection_set, info.fragments, tree)
+    return tree
+
+
+def get_ingredient_columns(selections):
+    """
+    Returns the Ingredient columns needed to resolve the selected fields, for use with only().
+    """
+    columns = ["id"]
+    for field in ("name", "notes"):
+        if field in selections:
+            columns.append(field)
+    if "category" in selections:
+        # The foreign key must stay loaded for select_related and prefetches
+        columns.append("category")
+        columns.append("category__id")
+        if "name" in selections["category"]:
+            columns.append("category__name")
+    return columns
 
 
 def update_fields(instance, fields):
@@ -62,6 +136,7 @@ class IngredientFilterInput(graphene.InputObjectType):
     name__icontains = graphene.String()
     id = graphene.Int()
 
+
 # Ingredient Order Types
 
 
@@ -79,6 +154,14 @@ class IngredientOrderInput(graphene.InputObjectType):
     field = graphene.Argument(IngredientOrderField, required=True)
     direction = graphene.Argument(OrderDirection, required=True)
 
+
+# order_by() argument for every (field, direction) pair of IngredientOrderInput
+INGREDIENT_ORDERINGS = {
+    (field, direction): f"{'-' if direction == OrderDirection.DESC else ''}{field.value}"
+    for field in IngredientOrderField
+    for direction in OrderDirection
+}
+
 # GraphQL Types
 
 
@@ -107,37 +190,98 @@ class IngredientQuery(graphene.ObjectType):
         where=graphene.Argument(IngredientFilterInput, required=False),
         first=graphene.Int(),
         offset=graphene.Int(),
+        after_id=graphene.ID(),
         order=graphene.Argument(IngredientOrderInput, required=False),
     )
 
     ingredient = graphene.Field(IngredientType, id=graphene.ID(required=True))
 
     def resolve_ingredient(root, info, id):
-        try:
-            return Ingredient.objects.get(id=id)
-        except Ingredient.DoesNotExist:
+        ingredient = Ingredient.objects.filter(pk=id).first()
+        if ingredient is None:
             raise GraphQLError(f"Ingredient with id {id} does not exist.")
+        return ingredient
+
+    def resolve_ingredients(root, info, where=None, first=None, offset=None, after_id=None, order=None):
+        if after_id is not None and order:
+            raise GraphQLError(
+                "afterId pages in id order and cannot be combined with order.")
+        if first is not None and first < 0:
+            raise GraphQLError("first must not be negative.")
+        if offset is not None and offset < 0:
+            raise GraphQLError("offset must not be negative.")
+        if after_id is not None:
+            try:
+                after_id = int(after_id)
+            except ValueError:
+                raise GraphQLError(
+                    f"afterId must be an ingredient id, got '{after_id}'.")
+
+        # Only run the queries for the fields the client asked for
+        selections = get_selections(info)
+        item_selections = selections.get("items", {})
+
+        # Start with the base queryset, loading only the selected columns
+        queryset = Ingredient.objects.only(
+            *get_ingredient_columns(item_selections))
+        if "category" in item_selections:
+            queryset = queryset.select_related("category")
 
-    def resolve_ingredients(root, info, where=None, first=None, offset=None, order=None):
-        # Start with the base queryset
-        queryset = Ingredient.objects.select_related("category")
+            # Fetch the ingredients of every listed category in one query
+            if "ingredients" in item_selections["category"]:
+                queryset = queryset.prefetch_related("category__ingredients")
 
         # Apply filters
-        filter_data = {key: value for key, value in (
-            where or {}).items() if value is not None}
+        where = where or {}
+        filter_data = {
+            key: value for key in INGREDIENT_FILTER_LOOKUPS
+            if (value := where.get(key)) is not None
+        }
         filtered_qs = apply_filters(queryset, filter_data)
 
         # Apply ordering
         ordered_qs = apply_ordering(filtered_qs, order)
 
-        # Get total count after filtering
-        total_count = ordered_qs.count()
+        # Reuse the ids and count of an identical earlier query
+        cache_key = get_ingredients_cache_key(
+            filter_data, order, first=first, offset=offset, after_id=after_id)
+        cached = cache.get(cache_key, {})
+        result = dict(cached)
+
+        total_count = result.get("total_count")
+        wants_total = "totalCount" in selections and total_count is None
 
         # Apply pagination
-        paginated_qs = apply_pagination(ordered_qs, first=first, offset=offset)
+        items = None
+        if "items" in selections:
+            ids = result.get("ids")
+            if ids is None:
+                page_qs = ordered_qs
+                # Count the matches in the page query itself with COUNT(*) OVER ();
+                # afterId narrows the rows, so its pages keep a separate count
+                count_in_page = wants_total and after_id is None
+                if count_in_page:
+                    page_qs = page_qs.annotate(
+                        window_total=Window(expression=Count("id")))
+                items = list(apply_pagination(
+                    page_qs, first=first, offset=offset, after_id=after_id))
+                result["ids"] = [item.pk for item in items]
+                if count_in_page and items:
+                    total_count = result["total_count"] = items[0].window_total
+                    wants_total = False
+            else:
+                items_by_id = queryset.in_bulk(ids)
+                items = [items_by_id[pk] for pk in ids if pk in items_by_id]
+
+        # Get total count after filtering, unless the page query already did
+        if wants_total:
+            total_count = result["total_count"] = ordered_qs.count()
+
+        if result != cached:
+            cache.set(cache_key, result, INGREDIENTS_LIST_CACHE_TIMEOUT)
 
         # Return the result
-        return IngredientListType(items=paginated_qs, total_count=total_count)
+        return IngredientListType(items=items, total_count=total_count)
 
 
 class CategoryQuery(graphene.ObjectType):
@@ -147,17 +291,23 @@ class CategoryQuery(graphene.ObjectType):
     )
 
     def resolve_category_by_name(root, info, name):
-        try:
-            return Category.objects.get(name=name)
-        except Category.DoesNotExist:
-            return None
+        queryset = Category.objects.all()
+        if "ingredients" in get_selections(info):
+            queryset = queryset.prefetch_related("ingredients")
+        return queryset.filter(name=name).first()
 
 
 class StatsQuery(graphene.ObjectType):
     total_ingredients = graphene.Int()
 
     def resolve_total_ingredients(root, info):
-        return Ingredient.objects.count()
+        # Served from the cache; creating or deleting an ingredient clears it
+        total = cache.get(INGREDIENT_COUNT_CACHE_KEY)
+        if total is None:
+            total = Ingredient.objects.count()
+            cache.set(INGREDIENT_COUNT_CACHE_KEY, total,
+                      INGREDIENT_COUNT_CACHE_TIMEOUT)
+        return total
 
 # Mutations
 
@@ -194,39 +344,63 @@ class UpsertIngredient(graphene.Mutation):
         category = None
         if category_name:
             try:
-                category, _ = Category.objects.get_or_create(
-                    name=category_name)
+                category_id = get_cached_category_id(category_name)
+                # Inside an outer transaction the deferred foreign key check only
+                # runs when it commits, too late to retry, so check a cached id now
+                if (category_id is not None
+                        and transaction.get_connection().in_atomic_block
+                        and not Category.objects.filter(pk=category_id).exists()):
+                    category_id = None
+                if category_id is None:
+                    category_id = get_or_create_category_id(category_name)
+                category = Category(id=category_id, name=category_name)
             except Exception as e:
                 raise GraphQLError(
                     f"Error creating or retrieving category: {str(e)}")
 
-        # Check for duplicate name if the name is being updated or if creating a new ingredient
-        if name and Ingredient.objects.filter(name=name).exclude(id=ingredient_id).exists():
-            raise GraphQLError(f"Ingredient with name '{
-                               name}' already exists.")
-
         # If ID is provided, update the existing ingredient
         if ingredient_id:
-            try:
-                ingredient = Ingredient.objects.get(id=ingredient_id)
-                # Update fields dynamically
-                update_fields(ingredient, {
-                    "name": name,
-                    "notes": notes,
-                    "category": category,
-                })
-                ingredient.save()
-            except Ingredient.DoesNotExist:
-                raise GraphQLError(f"Ingredient with id {
-                                   ingredient_id} does not exist.")
+            ingredient = Ingredient.objects.filter(pk=ingredient_id).first()
+            if ingredient is None:
+                raise GraphQLError(
+                    f"Ingredient with id {ingredient_id} does not exist.")
+            # Update fields dynamically
+            update_fields(ingredient, {
+                "name": name,
+                "notes": notes,
+                "category": category,
+            })
         else:
             # Create a new ingredient
-            ingredient = Ingredient.objects.create(
+            ingredient = Ingredient(
                 name=name,
                 notes=notes,
                 category=category,
             )
 
+        # The unique constraint on name rejects duplicates, so no separate check is needed
+        try:
+            with transaction.atomic():
+                ingredient.save()
+        except IntegrityError:
+            # Only report a duplicate when the name is what conflicted
+            if name and Ingredient.objects.filter(name=name).exclude(pk=ingredient.pk).exists():
+                raise GraphQLError(
+                    f"Ingredient with name '{name}' already exists.")
+            if category is None or Category.objects.filter(pk=category.pk).exists():
+                raise
+
+            # The cached category id is stale (the category was deleted,
+            # possibly by another process), so look it up again and retry once
+            ingredient.category = Category(
+                id=get_or_create_category_id(category_name),
+                name=category_name,
+            )
+            if not ingredient_id:
+                ingredient.pk = None
+            with transaction.atomic():
+                ingredient.save()
+
         return UpsertIngredient(ingredient=ingredient)
 
 
@@ -237,12 +411,11 @@ class DeleteIngredient(graphene.Mutation):
     success = graphene.Boolean()
 
     def mutate(self, info, id):
-        try:
-            ingredient = Ingredient.objects.get(id=id)
-            ingredient.delete()
-            return DeleteIngredient(success=True)
-        except Ingredient.DoesNotExist:
+        # The deleted row count tells whether the ingredient existed
+        deleted, _ = Ingredient.objects.filter(pk=id).delete()
+        if not deleted:
             raise GraphQLError(f"Ingredient with id {id} does not exist.")
+        return DeleteIngredient(success=True)
 
 
 class Mutation(graphene.ObjectType):
@@ -0,0 +1,58 @@
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from cookbook.ingredients.caches import (
+    INGREDIENT_COUNT_CACHE_KEY,
+    bump_ingredients_generation,
+    forget_category_id,
+)
+from cookbook.ingredients.models import Category, Ingredient
+
+
+@receiver(pre_save, sender=Category)
+def forget_renamed_category_id(sender, instance, **kwargs):
+    """
+    Drops the cached id under a category's old name when it is renamed.
+    """
+    # Set by Category.from_db and after each save; new instances have no old name
+    old_name = getattr(instance, "_loaded_name", None)
+    if old_name is not None and old_name != instance.name:
+        forget_category_id(old_name)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def forget_saved_category_id(sender, instance, **kwargs):
+    """
+    Drops the cached id of a category that was saved or deleted.
+    """
+    forget_category_id(instance.name)
+
+
+@receiver(post_save, sender=Category)
+def remember_saved_category_name(sender, instance, **kwargs):
+    """
+    Records the name a category was saved under, for spotting a later rename.
+    """
+    instance._loaded_name = instance.name
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_lists(sender, instance, **kwargs):
+    """
+    Moves the ingredient list cache to a new generation after any ingredient write.
+    """
+    bump_ingredients_generation()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def forget_ingredient_count(sender, instance, created=True, **kwargs):
+    """
+    Drops the cached total ingredient count when an ingredient is created or deleted.
+    """
+    # post_delete passes no created flag; updates leave the count unchanged
+    if created:
+        cache.delete(INGREDIENT_COUNT_CACHE_KEY)
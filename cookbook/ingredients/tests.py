@@ -1,3 +1,375 @@
-from django.test import TestCase
+import json
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from cookbook.ingredients.caches import get_category_id_cache_key
+from cookbook.ingredients.models import Category, Ingredient
+from cookbook.ingredients.schema import (
+    DEFAULT_PAGE_SIZE,
+    INGREDIENT_ORDERINGS,
+    MAX_PAGE_SIZE,
+    IngredientOrderField,
+    OrderDirection,
+)
+from cookbook.schema import schema
+from cookbook.views import DOCUMENT_CACHE_MAX_QUERY_LENGTH, cached_parse_and_validate
+
+
+class GraphQLTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        cached_parse_and_validate.cache_clear()
+        self.dairy = Category.objects.create(name="Dairy")
+        self.milk = Ingredient.objects.create(
+            name="Milk", notes="Cold", category=self.dairy)
+        self.eggs = Ingredient.objects.create(
+            name="Eggs", notes="Fresh", category=self.dairy)
+
+    def post(self, query):
+        response = self.client.post(
+            "/graphql", json.dumps({"query": query}), content_type="application/json")
+        return response.status_code, response.json()
+
+
+class IngredientListCacheTests(GraphQLTestCase):
+    def test_repeated_query_is_served_from_cache(self):
+        query = '{ ingredients(where: {name_Icontains: "e"}) { totalCount } }'
+        self.post(query)
+        with self.assertNumQueries(0):
+            _, body = self.post(query)
+        self.assertEqual(body["data"]["ingredients"]["totalCount"], 1)
+
+    def test_upsert_invalidates_cached_lists(self):
+        query = '{ ingredients(order: {field: id, direction: ASC}) { totalCount items { name } } }'
+        self.post(query)
+        self.post(
+            'mutation { upsertIngredient(input: {name: "Cream", notes: "Thick", '
+            'categoryName: "Dairy"}) { ingredient { id } } }')
+        _, body = self.post(query)
+        self.assertEqual(body["data"]["ingredients"], {
+            "totalCount": 3,
+            "items": [{"name": "Milk"}, {"name": "Eggs"}, {"name": "Cream"}],
+        })
+
+    def test_delete_invalidates_cached_lists_and_count(self):
+        query = '{ totalIngredients ingredients { totalCount items { name } } }'
+        self.post(query)
+        self.post(f"mutation {{ deleteIngredient(id: {self.milk.id}) {{ success }} }}")
+        _, body = self.post(query)
+        self.assertEqual(body["data"], {
+            "totalIngredients": 1,
+            "ingredients": {"totalCount": 1, "items": [{"name": "Eggs"}]},
+        })
+
+    def test_writes_outside_graphql_invalidate_cached_lists(self):
+        query = '{ totalIngredients ingredients(where: {name_Icontains: "e"}) { items { name } } }'
+        self.post(query)
+        self.eggs.name = "Oats"
+        self.eggs.save()
+        Ingredient.objects.create(name="Cheese", notes="Aged", category=self.dairy)
+        _, body = self.post(query)
+        self.assertEqual(body["data"], {
+            "totalIngredients": 3,
+            "ingredients": {"items": [{"name": "Cheese"}]},
+        })
+
+
+class PaginationTests(GraphQLTestCase):
+    def items(self, arguments):
+        _, body = self.post(f"{{ ingredients({arguments}) {{ items {{ id }} }} }}")
+        return body
+
+    def test_pages_are_capped(self):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f"Spice {n}", notes="", category=self.dairy)
+            for n in range(MAX_PAGE_SIZE))
+        capped = self.items("first: 500")["data"]["ingredients"]["items"]
+        self.assertEqual(len(capped), MAX_PAGE_SIZE)
+        default = self.items("offset: 0")["data"]["ingredients"]["items"]
+        self.assertEqual(len(default), DEFAULT_PAGE_SIZE)
+
+    def test_pages_default_to_id_order(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.items("first: 1")
+        self.assertIn('ORDER BY "ingredients_ingredient"."id" ASC', queries[0]["sql"])
+
+    def test_after_id_continues_in_id_order(self):
+        cheese = Ingredient.objects.create(name="Cheese", notes="Aged", category=self.dairy)
+        body = self.items(f'first: 1, afterId: "{self.milk.id}"')
+        self.assertEqual(body["data"]["ingredients"]["items"], [{"id": str(self.eggs.id)}])
+        body = self.items(f"afterId: {self.eggs.id}")
+        self.assertEqual(body["data"]["ingredients"]["items"], [{"id": str(cheese.id)}])
+
+    def test_after_id_cannot_be_combined_with_order(self):
+        body = self.items(f"afterId: {self.milk.id}, order: {{field: name, direction: ASC}}")
+        self.assertEqual(
+            body["errors"][0]["message"],
+            "afterId pages in id order and cannot be combined with order.")
+
+    def test_invalid_arguments_are_rejected(self):
+        for arguments, message in [
+            ('afterId: "abc"', "afterId must be an ingredient id, got 'abc'."),
+            ("first: -1", "first must not be negative."),
+            ("offset: -1", "offset must not be negative."),
+        ]:
+            self.assertEqual(self.items(arguments)["errors"][0]["message"], message)
+
+
+class DocumentCacheTests(GraphQLTestCase):
+    def test_repeated_query_skips_cached_parse_and_validate(self):
+        self.post("{ totalIngredients }")
+        self.post("{ totalIngredients }")
+        info = cached_parse_and_validate.cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 1))
+
+    def test_validation_errors_are_cached(self):
+        for _ in range(2):
+            status, body = self.post("{ ingredients { nope } }")
+            self.assertEqual(status, 400)
+            self.assertIn("Cannot query field 'nope'", body["errors"][0]["message"])
+        self.assertEqual(cached_parse_and_validate.cache_info().hits, 1)
+
+    def test_syntax_errors_are_reported_and_not_cached(self):
+        for _ in range(2):
+            status, body = self.post("{ ingredients {")
+            self.assertEqual(status, 400)
+            self.assertIn("Syntax Error", body["errors"][0]["message"])
+        self.assertEqual(cached_parse_and_validate.cache_info().currsize, 0)
+
+    def test_long_queries_are_not_cached(self):
+        query = "{ totalIngredients }".ljust(DOCUMENT_CACHE_MAX_QUERY_LENGTH + 1)
+        for _ in range(2):
+            _, body = self.post(query)
+            self.assertEqual(body["data"], {"totalIngredients": 2})
+        self.assertEqual(cached_parse_and_validate.cache_info().currsize, 0)
+
+    def test_get_rejects_mutations(self):
+        response = self.client.get(
+            "/graphql",
+            {"query": f"mutation {{ deleteIngredient(id: {self.milk.id}) {{ success }} }}"},
+            HTTP_ACCEPT="application/json",
+        )
+        self.assertEqual(response.status_code, 405)
+        self.assertTrue(Ingredient.objects.filter(pk=self.milk.pk).exists())
+
+
+class UpsertIngredientTests(GraphQLTestCase):
+    def test_duplicate_name_on_create(self):
+        _, body = self.post(
+            'mutation { upsertIngredient(input: {name: "Milk", notes: "Again", '
+            'categoryName: "Dairy"}) { ingredient { id } } }')
+        self.assertEqual(
+            body["errors"][0]["message"], "Ingredient with name 'Milk' already exists.")
+
+    def test_duplicate_name_on_update(self):
+        _, body = self.post(
+            f'mutation {{ upsertIngredient(input: {{id: {self.eggs.id}, name: "Milk"}}) '
+            '{ ingredient { id } } }')
+        self.assertEqual(
+            body["errors"][0]["message"], "Ingredient with name 'Milk' already exists.")
+        self.eggs.refresh_from_db()
+        self.assertEqual(self.eggs.name, "Eggs")
+
+    def test_other_integrity_errors_are_not_reported_as_duplicates(self):
+        _, body = self.post(
+            f'mutation {{ upsertIngredient(input: {{id: {self.eggs.id}, name: "Eggs"}}) '
+            '{ ingredient { id } } }')
+        self.assertNotIn("errors", body)
+
+        _, body = self.post(
+            'mutation { upsertIngredient(input: {name: "Butter", categoryName: "Dairy"}) '
+            '{ ingredient { id } } }')
+        self.assertIn("NOT NULL", body["errors"][0]["message"])
+
+    def test_stale_cached_category_id_is_resolved_again(self):
+        # As if another process deleted the category behind this one's cache
+        cache.set(get_category_id_cache_key("Dairy"), self.dairy.id + 1000)
+        _, body = self.post(
+            f'mutation {{ upsertIngredient(input: {{id: {self.eggs.id}, name: "Eggs", '
+            'categoryName: "Dairy"}) { ingredient { name category { name } } } }')
+        self.assertEqual(body["data"]["upsertIngredient"]["ingredient"], {
+            "name": "Eggs", "category": {"name": "Dairy"}})
+        self.eggs.refresh_from_db()
+        self.assertEqual(self.eggs.category_id, self.dairy.id)
+
+    def test_renamed_category_is_not_reused_for_its_old_name(self):
+        self.post(
+            'mutation { upsertIngredient(input: {name: "Cream", notes: "Thick", '
+            'categoryName: "Dairy"}) { ingredient { id } } }')
+        self.dairy.name = "Milk products"
+        self.dairy.save()
+        self.post(
+            'mutation { upsertIngredient(input: {name: "Yogurt", notes: "Sour", '
+            'categoryName: "Dairy"}) { ingredient { id } } }')
+        yogurt = Ingredient.objects.get(name="Yogurt")
+        self.assertEqual(yogurt.category.name, "Dairy")
+        self.assertNotEqual(yogurt.category_id, self.dairy.id)
+
+    def test_uncached_existing_category_costs_one_lookup(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.post(
+                'mutation { upsertIngredient(input: {name: "Cream", notes: "Thick", '
+                'categoryName: "Dairy"}) { ingredient { id } } }')
+        category_queries = [
+            query["sql"] for query in queries if "ingredients_category" in query["sql"]]
+        self.assertEqual(len(category_queries), 1)
+        self.assertEqual(cache.get(get_category_id_cache_key("Dairy")), self.dairy.id)
+
+    def test_renaming_a_loaded_category_runs_no_lookup(self):
+        dairy = Category.objects.get(pk=self.dairy.pk)
+        cache.set(get_category_id_cache_key("Dairy"), dairy.id)
+        dairy.name = "Milk products"
+        with self.assertNumQueries(1):
+            dairy.save()
+        self.assertIsNone(cache.get(get_category_id_cache_key("Dairy")))
+
+
+class StaleCategoryIdAutocommitTests(TransactionTestCase):
+    def test_stale_cached_category_id_is_retried_after_the_foreign_key_error(self):
+        cache.clear()
+        dairy = Category.objects.create(name="Dairy")
+        cache.set(get_category_id_cache_key("Dairy"), dairy.id + 1000)
+        response = self.client.post(
+            "/graphql",
+            json.dumps({"query": 'mutation { upsertIngredient(input: {name: "Cream", '
+                        'notes: "Thick", categoryName: "Dairy"}) { ingredient { id } } }'}),
+            content_type="application/json",
+        )
+        self.assertNotIn("errors", response.json())
+        self.assertEqual(Ingredient.objects.get(name="Cream").category_id, dairy.id)
+
+
+class CategoryLoadingTests(GraphQLTestCase):
+    def test_page_categories_load_with_the_page(self):
+        Ingredient.objects.create(
+            name="Bread", notes="Sliced", category=Category.objects.create(name="Bakery"))
+        with self.assertNumQueries(1):
+            _, body = self.post("{ ingredients { items { name category { name } } } }")
+        self.assertEqual(body["data"]["ingredients"]["items"], [
+            {"name": "Milk", "category": {"name": "Dairy"}},
+            {"name": "Eggs", "category": {"name": "Dairy"}},
+            {"name": "Bread", "category": {"name": "Bakery"}},
+        ])
+
+    def test_category_resolves_outside_the_view(self):
+        result = schema.execute(
+            f"{{ ingredient(id: {self.milk.id}) {{ category {{ name }} }} }}")
+        self.assertIsNone(result.errors)
+        self.assertEqual(result.data["ingredient"]["category"], {"name": "Dairy"})
+
+
+class PageTotalCountTests(GraphQLTestCase):
+    def test_items_and_total_count_share_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            _, body = self.post("{ ingredients { totalCount items { name } } }")
+        self.assertEqual(len(queries), 1)
+        self.assertIn("OVER ()", queries[0]["sql"])
+        self.assertEqual(body["data"]["ingredients"]["totalCount"], 2)
+
+    def test_empty_page_falls_back_to_a_count(self):
+        with self.assertNumQueries(2):
+            _, body = self.post("{ ingredients(offset: 5) { totalCount items { name } } }")
+        self.assertEqual(body["data"]["ingredients"], {"totalCount": 2, "items": []})
+
+    def test_after_id_falls_back_to_a_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            _, body = self.post(
+                f"{{ ingredients(afterId: {self.milk.id}) {{ totalCount items {{ name }} }} }}")
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn("OVER ()", queries[0]["sql"])
+        self.assertEqual(body["data"]["ingredients"], {
+            "totalCount": 2, "items": [{"name": "Eggs"}]})
+
+
+class SelectedListFieldTests(GraphQLTestCase):
+    def test_total_count_alone_runs_only_the_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            _, body = self.post("{ ingredients { totalCount } }")
+        self.assertEqual(len(queries), 1)
+        self.assertIn("COUNT(*)", queries[0]["sql"])
+        self.assertEqual(body["data"]["ingredients"], {"totalCount": 2})
+
+    def test_items_alone_run_no_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            _, body = self.post("{ ingredients { items { name } } }")
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("COUNT", queries[0]["sql"])
+        self.assertEqual(body["data"]["ingredients"]["items"], [{"name": "Milk"}, {"name": "Eggs"}])
+
+
+class CategoryIngredientsPrefetchTests(GraphQLTestCase):
+    def setUp(self):
+        super().setUp()
+        bakery = Category.objects.create(name="Bakery")
+        Ingredient.objects.create(name="Bread", notes="Sliced", category=bakery)
+        Ingredient.objects.create(name="Flour", notes="White", category=bakery)
+
+    def test_category_by_name_prefetches_its_ingredients(self):
+        with self.assertNumQueries(2):
+            _, body = self.post('{ categoryByName(name: "Bakery") { ingredients { name } } }')
+        self.assertEqual(body["data"]["categoryByName"]["ingredients"], [
+            {"name": "Bread"}, {"name": "Flour"}])
+
+    def test_listed_categories_prefetch_their_ingredients(self):
+        with self.assertNumQueries(2):
+            _, body = self.post(
+                "{ ingredients { items { name category { ingredients { name } } } } }")
+        items = body["data"]["ingredients"]["items"]
+        self.assertEqual(len(items), 4)
+        self.assertEqual(items[-1]["category"]["ingredients"], [
+            {"name": "Bread"}, {"name": "Flour"}])
+
+
+class SelectedColumnTests(GraphQLTestCase):
+    def page_sql(self, query):
+        with CaptureQueriesContext(connection) as queries:
+            self.post(query)
+        return queries[0]["sql"]
+
+    def test_only_selected_columns_are_loaded(self):
+        sql = self.page_sql("{ ingredients { items { name } } }")
+        self.assertIn('"ingredients_ingredient"."name"', sql)
+        self.assertNotIn('"notes"', sql)
+        self.assertNotIn('"category_id"', sql)
+
+    def test_category_columns_are_joined_when_selected(self):
+        sql = self.page_sql("{ ingredients { items { category { name } } } }")
+        self.assertIn('"ingredients_category"."name"', sql)
+        self.assertNotIn('"ingredients_ingredient"."name"', sql)
+        self.assertNotIn('"notes"', sql)
+
+
+class IngredientOrderingTests(GraphQLTestCase):
+    def test_every_order_input_has_an_ordering(self):
+        self.assertEqual(INGREDIENT_ORDERINGS, {
+            (IngredientOrderField.name, OrderDirection.ASC): "name",
+            (IngredientOrderField.name, OrderDirection.DESC): "-name",
+            (IngredientOrderField.id, OrderDirection.ASC): "id",
+            (IngredientOrderField.id, OrderDirection.DESC): "-id",
+        })
+
+    def test_orderings_are_applied(self):
+        for order, names in [
+            ("{field: name, direction: ASC}", ["Eggs", "Milk"]),
+            ("{field: id, direction: DESC}", ["Eggs", "Milk"]),
+            ("{field: name, direction: DESC}", ["Milk", "Eggs"]),
+        ]:
+            _, body = self.post(f"{{ ingredients(order: {order}) {{ items {{ name }} }} }}")
+            items = body["data"]["ingredients"]["items"]
+            self.assertEqual([item["name"] for item in items], names)
+
+
+class MissingIngredientTests(GraphQLTestCase):
+    def test_missing_ingredient_costs_one_query(self):
+        with self.assertNumQueries(1):
+            _, body = self.post("{ ingredient(id: 999) { name } }")
+        self.assertEqual(body["errors"][0]["message"], "Ingredient with id 999 does not exist.")
+
+    def test_deleting_a_missing_ingredient_costs_one_query(self):
+        with self.assertNumQueries(1):
+            _, body = self.post("mutation { deleteIngredient(id: 999) { success } }")
+        self.assertEqual(body["errors"][0]["message"], "Ingredient with id 999 does not exist.")
+        self.assertEqual(Ingredient.objects.count(), 2)
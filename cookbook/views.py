@@ -0,0 +1,125 @@
+from functools import lru_cache
+
+from django.db import connection, transaction
+from django.http import HttpResponseBadRequest, HttpResponseNotAllowed
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.views import GraphQLView, HttpError
+from graphql import (
+    ExecutionResult,
+    OperationType,
+    execute,
+    get_operation_ast,
+    parse,
+    validate_schema,
+)
+from graphql.validation import validate
+
+# Number of distinct query strings whose parsed and validated documents are kept
+DOCUMENT_CACHE_SIZE = 256
+
+# Longest query string (in characters) that is cached; longer ones are parsed and
+# validated on every request so they cannot fill the cache with large documents
+DOCUMENT_CACHE_MAX_QUERY_LENGTH = 4096
+
+
+def parse_and_validate(schema, query, validation_rules=None):
+    """
+    Parses and validates a query string, returning the document and its validation errors.
+    """
+    document = parse(query)
+    validation_errors = validate(
+        schema,
+        document,
+        validation_rules,
+        graphene_settings.MAX_VALIDATION_ERRORS,
+    )
+    return document, validation_errors
+
+
+cached_parse_and_validate = lru_cache(
+    maxsize=DOCUMENT_CACHE_SIZE)(parse_and_validate)
+
+
+class CookbookGraphQLView(GraphQLView):
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        # Mirrors GraphQLView.execute_graphql_request from graphene-django 3.2.2,
+        # except that repeated queries skip parse and validate; re-check it when
+        # upgrading graphene-django
+        if not query:
+            if show_graphiql:
+                return None
+            raise HttpError(HttpResponseBadRequest(
+                "Must provide query string."))
+
+        schema = self.schema.graphql_schema
+
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return ExecutionResult(data=None, errors=schema_validation_errors)
+
+        validation_rules = None
+        if self.validation_rules is not None:
+            validation_rules = tuple(self.validation_rules)
+        if len(query) <= DOCUMENT_CACHE_MAX_QUERY_LENGTH:
+            parse_and_validate_query = cached_parse_and_validate
+        else:
+            parse_and_validate_query = parse_and_validate
+        try:
+            document, validation_errors = parse_and_validate_query(
+                schema, query, validation_rules)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+        operation_ast = get_operation_ast(document, operation_name)
+
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None
+
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(
+                        operation_ast.operation.value
+                    ),
+                )
+            )
+
+        if validation_errors:
+            return ExecutionResult(data=None, errors=validation_errors)
+
+        try:
+            execute_options = {
+                "root_value": self.get_root_value(request),
+                "context_value": self.get_context(request),
+                "variable_values": variables,
+                "operation_name": operation_name,
+                "middleware": self.get_middleware(request),
+            }
+            if self.execution_context_class:
+                execute_options["execution_context_class"] = self.execution_context_class
+
+            if (
+                operation_ast is not None
+                and operation_ast.operation == OperationType.MUTATION
+                and (
+                    graphene_settings.ATOMIC_MUTATIONS is True
+                    or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+                )
+            ):
+                with transaction.atomic():
+                    result = execute(schema, document, **execute_options)
+                    if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                        transaction.set_rollback(True)
+                return result
+
+            return execute(schema, document, **execute_options)
+        except Exception as e:
+            return ExecutionResult(errors=[e])